@@ -1,10 +1,27 @@
 """Representation of a WeMo Humidifier device."""
 
-from xml.etree import cElementTree as et
+import functools
 import sys
 from pywemo.ouimeaux_device.api.xsd.device import quote_xml
 from .switch import Switch
 
+# Only report <attribute> elements, drop whitespace-only text between
+# them and skip libxml2's ID bookkeeping. ElementTree takes none of these.
+_LXML_PULL_PARSER_OPTIONS = {
+    "tag": "attribute",
+    "remove_blank_text": True,
+    "collect_ids": False,
+}
+
+try:
+    from lxml import etree as et
+
+    _PULL_PARSER_OPTIONS = _LXML_PULL_PARSER_OPTIONS
+except ImportError:
+    from xml.etree import cElementTree as et
+
+    _PULL_PARSER_OPTIONS = {}
+
 
 if sys.version_info[0] < 3:
     class IntEnum:
@@ -31,6 +48,9 @@ class FanMode(IntEnum):
     Maximum = 5
 
 
+# Plain int for the get_state() comparison, avoiding the enum member lookup.
+_FAN_MODE_OFF = int(FanMode.Off)
+
 FAN_MODE_NAMES = {
     FanMode.Off: "Off",
     FanMode.Minimum: "Minimum",
@@ -74,71 +94,171 @@ WATER_LEVEL_NAMES = {
     WaterLevel.Good: "Good",
 }
 
+# The enum values are contiguous from 0, so the properties index these
+# tuples directly instead of hashing into the dicts above.
+_FAN_MODE_STRINGS = tuple(FAN_MODE_NAMES[mode] for mode in FanMode)
+_DESIRED_HUMIDITY_STRINGS = tuple(
+    DESIRED_HUMIDITY_NAMES[humidity] for humidity in DesiredHumidity)
+_WATER_LEVEL_STRINGS = tuple(WATER_LEVEL_NAMES[level] for level in WaterLevel)
+
+# The attributeList is a sequence of sibling <attribute> elements, so it
+# is wrapped in a root element before being fed to the parser.
+_ATTRIBUTES_START = b"<attributes>"
+_ATTRIBUTES_END = b"</attributes>"
+
+# Parsed attribute lists are cached by their raw blob, as devices keep
+# reporting the same one while their state is unchanged. Unusually long
+# blobs bypass the cache to bound its memory use.
+_PARSE_CACHE_SIZE = 32
+_PARSE_CACHE_MAX_BLOB_LENGTH = 4096
+
+# Templates for the attributeList sent to the device by SetAttributes.
+_FAN_MODE_TEMPLATE = (
+    "<attribute><name>FanMode</name><value>{}</value></attribute>")
+_DESIRED_HUMIDITY_TEMPLATE = (
+    "<attribute><name>DesiredHumidity</name><value>{}</value></attribute>")
+_FILTER_LIFE_TEMPLATE = (
+    "<attribute><name>FilterLife</name><value>{}</value></attribute>")
+
+# The fan mode and desired humidity only take a handful of values, so
+# their quoted attributes are built once rather than on every call.
+_QUOTED_FAN_MODES = {
+    int(mode): quote_xml(_FAN_MODE_TEMPLATE.format(int(mode)))
+    for mode in FanMode
+}
+_QUOTED_DESIRED_HUMIDITIES = {
+    int(humidity): quote_xml(_DESIRED_HUMIDITY_TEMPLATE.format(int(humidity)))
+    for humidity in DesiredHumidity
+}
+
+
+def _quoted_attribute(quoted, template, value):
+    """Return the quoted attribute for value, building unknown ones."""
+    value = int(value)
+    try:
+        return quoted[value]
+    except KeyError:
+        return quote_xml(template.format(value))
+
+
 FILTER_LIFE_MAX = 60480
+# Converts a raw FilterLife value into a percentage of FILTER_LIFE_MAX.
+_FILTER_SCALE = 100.0 / FILTER_LIFE_MAX
 
 
-def attribute_xml_to_dict(xml_blob):
-    """Return attribute values as a dict of key value pairs."""
-    xml_blob = "<attributes>" + xml_blob + "</attributes>"
-    xml_blob = xml_blob.replace("&gt;", ">")
-    xml_blob = xml_blob.replace("&lt;", "<")
+def _set_fan_mode(value, result):
+    result["fan_mode"] = int(value)
 
-    result = {}
 
-    attributes = et.fromstring(xml_blob)
+def _set_desired_humidity(value, result):
+    result["desired_humidity"] = int(value)
 
-    result["water_level"] = int(2)
 
-    for attribute in attributes:
-        if attribute[0].text == "FanMode":
-            try:
-                result["fan_mode"] = int(attribute[1].text)
-            except ValueError:
-                pass
-        elif attribute[0].text == "DesiredHumidity":
-            try:
-                result["desired_humidity"] = int(attribute[1].text)
-            except ValueError:
-                pass
-        elif attribute[0].text == "CurrentHumidity":
-            try:
-                result["current_humidity"] = float(attribute[1].text)
-            except ValueError:
-                pass
-        elif attribute[0].text == "NoWater" and attribute[1].text == "1":
-            try:
-                result["water_level"] = int(0)
-            except ValueError:
-                pass
-        elif attribute[0].text == "WaterAdvise" and attribute[1].text == "1":
-            try:
-                result["water_level"] = int(1)
-            except ValueError:
-                pass
-        elif attribute[0].text == "FilterLife":
-            try:
-                result["filter_life"] = float(round((float(attribute[1].text)
-                                                     / float(60480))
-                                                    * float(100), 2))
-            except ValueError:
-                pass
-        elif attribute[0].text == "ExpiredFilterTime":
+def _set_current_humidity(value, result):
+    result["current_humidity"] = float(value)
+
+
+def _set_no_water(value, result):
+    if value == "1":
+        result["water_level"] = 0
+
+
+def _set_water_advise(value, result):
+    if value == "1":
+        result["water_level"] = 1
+
+
+def _set_filter_life(value, result):
+    result["filter_life"] = round(float(value) * _FILTER_SCALE, 2)
+
+
+def _set_filter_expired(value, result):
+    result["filter_expired"] = bool(int(value))
+
+
+# Map each attribute name reported by the device to the function that
+# stores its (converted) value in the result dict. Parsed names are not
+# sys.intern()ed first: that costs the same hash lookup the dict does.
+_ATTRIBUTE_HANDLERS = {
+    "FanMode": _set_fan_mode,
+    "DesiredHumidity": _set_desired_humidity,
+    "CurrentHumidity": _set_current_humidity,
+    "NoWater": _set_no_water,
+    "WaterAdvise": _set_water_advise,
+    "FilterLife": _set_filter_life,
+    "ExpiredFilterTime": _set_filter_expired,
+}
+
+
+def _unescape_attribute_list(xml_blob):
+    """Undo the extra level of escaping the device applies to the XML."""
+    # Two C-level str.replace passes beat a regex or html.unescape (both
+    # call back into Python per entity); skip them for unescaped blobs.
+    if "&lt;" not in xml_blob:
+        return xml_blob
+    return xml_blob.replace("&gt;", ">").replace("&lt;", "<")
+
+
+def _parse_attribute_list(xml_blob):
+    """Parse an attributeList blob into a new dict."""
+    parser = et.XMLPullParser(events=("end",), **_PULL_PARSER_OPTIONS)
+    parser.feed(_ATTRIBUTES_START)
+    parser.feed(_unescape_attribute_list(xml_blob).encode("utf-8"))
+    parser.feed(_ATTRIBUTES_END)
+    # The blob is small and already in memory, so it is parsed in full
+    # (raising on malformed input) before any attribute is handled.
+    parser.close()
+
+    result = {"water_level": 2}
+
+    # Bound once here as this loop runs for every attribute of every event.
+    get_handler = _ATTRIBUTE_HANDLERS.get
+
+    # read_events() drains the parser's own event queue, so the
+    # attributes are dispatched as they are popped, without another buffer.
+    for _, attribute in parser.read_events():
+        if attribute.tag != "attribute":
+            continue
+
+        handler = get_handler(attribute.findtext("name"))
+        if handler is not None:
             try:
-                result["filter_expired"] = bool(int(attribute[1].text))
-            except ValueError:
+                handler(attribute.findtext("value"), result)
+            except (ValueError, TypeError):
                 pass
 
     return result
 
 
+_cached_parse_attribute_list = functools.lru_cache(
+    maxsize=_PARSE_CACHE_SIZE)(_parse_attribute_list)
+
+
+def attribute_xml_to_dict(xml_blob):
+    """Return attribute values as a dict of key value pairs."""
+    if len(xml_blob) > _PARSE_CACHE_MAX_BLOB_LENGTH:
+        return _parse_attribute_list(xml_blob)
+
+    # Copy so callers are free to modify the dict they get back.
+    return dict(_cached_parse_attribute_list(xml_blob))
+
+
 class Humidifier(Switch):
     """Representation of a WeMo Humidifier device."""
 
+    # No __slots__ here: Device sets its services as instance attributes
+    # and replaces __dict__ wholesale when reconnecting, which would leave
+    # slot values such as _attributes behind.
+
     def __init__(self, *args, **kwargs):
         """Create a WeMo Humidifier device."""
         Switch.__init__(self, *args, **kwargs)
+        # Attributes are fetched on first use rather than here, so creating
+        # the device during discovery doesn't wait on another request.
+        # Subscription events may fill in some of them before that, so
+        # _attributes_fetched tracks whether a full read has happened.
         self._attributes = {}
-        self.update_attributes()
+        self._attributes_fetched = False
 
     def __repr__(self):
         """Return a string representation of the device."""
@@ -149,18 +269,27 @@ class Humidifier(Switch):
         # pylint: disable=maybe-no-member
         resp = self.deviceevent.GetAttributes().get('attributeList')
         self._attributes = attribute_xml_to_dict(resp)
-        self._state = self.fan_mode
+        self._attributes_fetched = True
+        self._state = self._attributes.get('fan_mode')
 
     def subscription_update(self, _type, _params):
         """Handle reports from device."""
         if _type == "attributeList":
             self._attributes.update(attribute_xml_to_dict(_params))
-            self._state = self.fan_mode
+            # Always re-derive the state: a BinaryState event may have
+            # overwritten it even though the fan mode did not change.
+            self._state = self._attributes.get('fan_mode')
 
             return True
 
         return Switch.subscription_update(self, _type, _params)
 
+    def _get_attribute(self, key):
+        """Return an attribute value, requesting state on first access."""
+        if not self._attributes_fetched:
+            self.update_attributes()
+        return self._attributes.get(key)
+
     @property
     def device_type(self):
         """Return what kind of WeMo this device is."""
@@ -169,7 +298,7 @@ class Humidifier(Switch):
     @property
     def fan_mode(self):
         """Return the FanMode setting (as an int index of the IntEnum)."""
-        return self._attributes.get('fan_mode')
+        return self._get_attribute('fan_mode')
 
     @property
     def fan_mode_string(self):
@@ -178,42 +307,52 @@ class Humidifier(Switch):
 
         (Off, Low, Medium, High, Maximum).
         """
-        return FAN_MODE_NAMES.get(self.fan_mode, "Unknown")
+        fan_mode = self.fan_mode
+        if fan_mode is not None and 0 <= fan_mode < len(_FAN_MODE_STRINGS):
+            return _FAN_MODE_STRINGS[fan_mode]
+        return "Unknown"
 
     @property
     def desired_humidity(self):
         """Return the desired humidity (as an int index of the IntEnum)."""
-        return self._attributes.get('desired_humidity')
+        return self._get_attribute('desired_humidity')
 
     @property
     def desired_humidity_percent(self):
         """Return the desired humidity in percent (string)."""
-        return DESIRED_HUMIDITY_NAMES.get(self.desired_humidity, "Unknown")
+        humidity = self.desired_humidity
+        if (humidity is not None and
+                0 <= humidity < len(_DESIRED_HUMIDITY_STRINGS)):
+            return _DESIRED_HUMIDITY_STRINGS[humidity]
+        return "Unknown"
 
     @property
     def current_humidity_percent(self):
         """Return the observed relative humidity in percent (float)."""
-        return self._attributes.get('current_humidity')
+        return self._get_attribute('current_humidity')
 
     @property
     def water_level(self):
         """Return 0 if water level is Empty, 1 if Low, and 2 if Good."""
-        return self._attributes.get('water_level')
+        return self._get_attribute('water_level')
 
     @property
     def water_level_string(self):
         """Return Empty, Low, or Good depending on the water level."""
-        return WATER_LEVEL_NAMES.get(self.water_level, "Unknown")
+        level = self.water_level
+        if level is not None and 0 <= level < len(_WATER_LEVEL_STRINGS):
+            return _WATER_LEVEL_STRINGS[level]
+        return "Unknown"
 
     @property
     def filter_life_percent(self):
         """Return the percentage (float) of filter life remaining."""
-        return self._attributes.get('filter_life')
+        return self._get_attribute('filter_life')
 
     @property
     def filter_expired(self):
         """Return 0 if filter is OK, and 1 if it needs to be changed."""
-        return self._attributes.get('filter_expired')
+        return self._get_attribute('filter_expired')
 
     def get_state(self, force_update=False):
         """Return 0 if off and 1 if on."""
@@ -224,7 +363,7 @@ class Humidifier(Switch):
             self.update_attributes()
 
         # Consider the Humidifier to be "on" if it's not off.
-        return int(self._state != FanMode.Off)
+        return int(self._state != _FAN_MODE_OFF)
 
     def set_state(self, state):
         """
@@ -234,56 +373,71 @@ class Humidifier(Switch):
         """
         self.set_fan_mode(state)
 
-    def set_fan_mode(self, fan_mode):
+    def _apply_sent_attributes(self, refresh, **attributes):
+        """Record attributes sent to the device, or re-read its state."""
+        # The other attributes are unknown until the state has been read
+        # once, so fall back to a refresh in that case too.
+        if refresh or not self._attributes_fetched:
+            self.get_state(True)
+            return
+
+        self._attributes.update(attributes)
+        self._state = self._attributes.get('fan_mode')
+
+    def set_fan_mode(self, fan_mode, refresh=False):
         """
         Set the fan mode of this device (as int index of the FanMode IntEnum).
 
         Provided for compatibility with the Switch base class.
+        Pass refresh=True to re-read the state from the device afterwards.
         """
         # Send the attribute list to the device
         # pylint: disable=maybe-no-member
-        self.deviceevent.SetAttributes(attributeList=quote_xml(
-            "<attribute><name>FanMode</name><value>" +
-            str(int(fan_mode)) + "</value></attribute>"))
+        self.deviceevent.SetAttributes(attributeList=_quoted_attribute(
+            _QUOTED_FAN_MODES, _FAN_MODE_TEMPLATE, fan_mode))
 
-        # Refresh the device state
-        self.get_state(True)
+        self._apply_sent_attributes(refresh, fan_mode=int(fan_mode))
 
-    def set_humidity(self, desired_humidity):
-        """Set the desired humidity (as int index of the IntEnum)."""
+    def set_humidity(self, desired_humidity, refresh=False):
+        """
+        Set the desired humidity (as int index of the IntEnum).
+
+        Pass refresh=True to re-read the state from the device afterwards.
+        """
         # Send the attribute list to the device
         # pylint: disable=maybe-no-member
-        self.deviceevent.SetAttributes(attributeList=quote_xml(
-            "<attribute><name>DesiredHumidity</name><value>" +
-            str(int(desired_humidity)) + "</value></attribute>"))
+        self.deviceevent.SetAttributes(attributeList=_quoted_attribute(
+            _QUOTED_DESIRED_HUMIDITIES, _DESIRED_HUMIDITY_TEMPLATE,
+            desired_humidity))
 
-        # Refresh the device state
-        self.get_state(True)
+        self._apply_sent_attributes(
+            refresh, desired_humidity=int(desired_humidity))
 
-    def set_fan_mode_and_humidity(self, fan_mode, desired_humidity):
+    def set_fan_mode_and_humidity(self, fan_mode, desired_humidity,
+                                  refresh=False):
         """
         Set the desired humidity and fan mode.
 
         (as int index of their respective IntEnums)
+        Pass refresh=True to re-read the state from the device afterwards.
         """
         # Send the attribute list to the device
         # pylint: disable=maybe-no-member
-        self.deviceevent.SetAttributes(attributeList=quote_xml(
-            "<attribute><name>FanMode</name><value>" +
-            str(int(fan_mode)) + "</value></attribute>" +
-            "<attribute><name>DesiredHumidity</name><value>" +
-            str(int(desired_humidity)) + "</value></attribute>"))
+        self.deviceevent.SetAttributes(attributeList=_quoted_attribute(
+            _QUOTED_FAN_MODES, _FAN_MODE_TEMPLATE, fan_mode) +
+            _quoted_attribute(
+                _QUOTED_DESIRED_HUMIDITIES, _DESIRED_HUMIDITY_TEMPLATE,
+                desired_humidity))
 
-        # Refresh the device state
-        self.get_state(True)
+        self._apply_sent_attributes(refresh, fan_mode=int(fan_mode),
+                                    desired_humidity=int(desired_humidity))
 
     def reset_filter_life(self):
         """Reset the filter life (call this when you install a new filter)."""
         # Send the attribute list to the device
         # pylint: disable=maybe-no-member
         self.deviceevent.SetAttributes(attributeList=quote_xml(
-            "<attribute><name>FilterLife</name><value>" +
-            str(FILTER_LIFE_MAX) + "</value></attribute>"))
+            _FILTER_LIFE_TEMPLATE.format(FILTER_LIFE_MAX)))
 
         # Refresh the device state
         self.get_state(True)
@@ -21,7 +21,7 @@ pip install poetry
 
 echo
 echo "===Installing dependencies==="
-poetry install
+poetry install --extras lxml
 
 
 echo
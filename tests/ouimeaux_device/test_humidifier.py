@@ -0,0 +1,217 @@
+"""Tests for pywemo.ouimeaux_device.humidifier."""
+
+import unittest.mock as mock
+from xml.etree import ElementTree
+
+import pytest
+
+import pywemo.ouimeaux_device.humidifier as humidifier
+
+
+def attribute_list(**attributes):
+    """Build an escaped attributeList blob like the one the device sends."""
+    return "".join(
+        "&lt;attribute&gt;&lt;name&gt;{}&lt;/name&gt;"
+        "&lt;value&gt;{}&lt;/value&gt;&lt;/attribute&gt;".format(name, value)
+        for name, value in attributes.items()
+    )
+
+
+@pytest.fixture(params=["lxml", "ElementTree"])
+def parser_backend(request, monkeypatch):
+    """Run the parsing tests against both lxml and the stdlib fallback."""
+    if request.param == "lxml":
+        etree = pytest.importorskip("lxml.etree")
+        options = humidifier._LXML_PULL_PARSER_OPTIONS
+    else:
+        etree = ElementTree
+        options = {}
+
+    monkeypatch.setattr(humidifier, "et", etree)
+    monkeypatch.setattr(humidifier, "_PULL_PARSER_OPTIONS", options)
+    # Results cached under the other backend would mask this one.
+    humidifier._cached_parse_attribute_list.cache_clear()
+    yield request.param
+    humidifier._cached_parse_attribute_list.cache_clear()
+
+
+@pytest.mark.usefixtures("parser_backend")
+class TestAttributeXmlToDict:
+    def test_parses_all_known_attributes(self):
+        result = humidifier.attribute_xml_to_dict(attribute_list(
+            FanMode=3,
+            DesiredHumidity=1,
+            CurrentHumidity="42.5",
+            NoWater=0,
+            WaterAdvise=0,
+            FilterLife=30240,
+            ExpiredFilterTime=1,
+        ))
+
+        assert result == {
+            "fan_mode": 3,
+            "desired_humidity": 1,
+            "current_humidity": 42.5,
+            "water_level": 2,
+            "filter_life": 50.0,
+            "filter_expired": True,
+        }
+
+    def test_no_water_takes_precedence_over_default(self):
+        result = humidifier.attribute_xml_to_dict(attribute_list(NoWater=1))
+
+        assert result["water_level"] == 0
+
+    def test_water_advise_sets_low_water_level(self):
+        result = humidifier.attribute_xml_to_dict(
+            attribute_list(WaterAdvise=1)
+        )
+
+        assert result["water_level"] == 1
+
+    def test_invalid_values_are_skipped(self):
+        result = humidifier.attribute_xml_to_dict(
+            attribute_list(FanMode="bogus", DesiredHumidity=2)
+        )
+
+        assert "fan_mode" not in result
+        assert result["desired_humidity"] == 2
+
+    def test_unknown_attributes_are_ignored(self):
+        result = humidifier.attribute_xml_to_dict(
+            attribute_list(SomethingElse=7)
+        )
+
+        assert result == {"water_level": 2}
+
+    def test_accepts_unescaped_attribute_list(self):
+        blob = attribute_list(FanMode=4).replace("&lt;", "<").replace(
+            "&gt;", ">"
+        )
+
+        assert humidifier.attribute_xml_to_dict(blob)["fan_mode"] == 4
+
+    def test_returned_dict_is_not_shared_between_calls(self):
+        blob = attribute_list(FanMode=2)
+
+        humidifier.attribute_xml_to_dict(blob)["fan_mode"] = 5
+
+        assert humidifier.attribute_xml_to_dict(blob)["fan_mode"] == 2
+
+
+class TestHumidifier:
+    @staticmethod
+    def get_humidifier(attributes=None, state=None):
+        device = humidifier.Humidifier.__new__(humidifier.Humidifier)
+        device._attributes = dict(attributes or {})
+        device._state = state
+        device._attributes_fetched = attributes is not None
+        device.deviceevent = mock.Mock()
+        device.deviceevent.GetAttributes.return_value = {
+            "attributeList": attribute_list(FanMode=2, DesiredHumidity=1)
+        }
+        return device
+
+    def test_subscription_update_applies_changed_attributes(self):
+        device = self.get_humidifier({"fan_mode": 1, "water_level": 2}, 1)
+
+        assert device.subscription_update(
+            "attributeList", attribute_list(FanMode=3, NoWater=1)
+        )
+
+        assert device.fan_mode == 3
+        assert device.water_level == 0
+        assert device._state == 3
+
+    def test_subscription_update_restores_state_after_binary_state(self):
+        device = self.get_humidifier({"fan_mode": 3, "water_level": 2}, 3)
+
+        device.subscription_update("BinaryState", "0")
+        device.subscription_update("attributeList", attribute_list(FanMode=3))
+
+        assert device._state == 3
+        assert device.get_state() == 1
+
+    def test_set_fan_mode_and_humidity_sends_both_attributes(self):
+        device = self.get_humidifier()
+
+        device.set_fan_mode_and_humidity(
+            humidifier.FanMode.Low, humidifier.DesiredHumidity.FiftyPercent
+        )
+
+        device.deviceevent.SetAttributes.assert_called_once_with(
+            attributeList=attribute_list(FanMode=2, DesiredHumidity=1)
+        )
+
+    def test_attributes_are_requested_on_first_access(self):
+        device = self.get_humidifier()
+
+        assert device.desired_humidity_percent == "50"
+        assert device.fan_mode == 2
+        device.deviceevent.GetAttributes.assert_called_once_with()
+
+    def test_subscription_update_before_first_access_still_fetches(self):
+        device = self.get_humidifier()
+
+        device.subscription_update(
+            "attributeList", attribute_list(CurrentHumidity=40)
+        )
+
+        assert device.desired_humidity == 1
+        assert device.fan_mode == 2
+        device.deviceevent.GetAttributes.assert_called_once_with()
+
+    def test_set_fan_mode_before_first_access_requests_state(self):
+        device = self.get_humidifier()
+        device.subscription_update(
+            "attributeList", attribute_list(CurrentHumidity=40)
+        )
+
+        device.set_fan_mode(humidifier.FanMode.Low)
+
+        device.deviceevent.GetAttributes.assert_called_once_with()
+        assert device.desired_humidity == 1
+
+    def test_set_fan_mode_accepts_values_outside_the_enum(self):
+        device = self.get_humidifier()
+
+        device.set_fan_mode(9)
+
+        device.deviceevent.SetAttributes.assert_called_once_with(
+            attributeList=attribute_list(FanMode=9)
+        )
+
+    def test_set_fan_mode_updates_known_state_without_request(self):
+        device = self.get_humidifier({"fan_mode": 0, "water_level": 2}, 0)
+
+        device.set_fan_mode(humidifier.FanMode.High)
+
+        assert device.fan_mode == 4
+        assert device.get_state() == 1
+        device.deviceevent.GetAttributes.assert_not_called()
+
+    def test_set_humidity_with_refresh_requests_state(self):
+        device = self.get_humidifier({"fan_mode": 0, "water_level": 2}, 0)
+
+        device.set_humidity(humidifier.DesiredHumidity.SixtyPercent, True)
+
+        device.deviceevent.GetAttributes.assert_called_once_with()
+        assert device.desired_humidity == 1
+
+    def test_name_properties(self):
+        device = self.get_humidifier(
+            {"fan_mode": 5, "desired_humidity": 4, "water_level": 1}
+        )
+
+        assert device.fan_mode_string == "Maximum"
+        assert device.desired_humidity_percent == "100"
+        assert device.water_level_string == "Low"
+
+    def test_name_properties_for_unknown_values(self):
+        device = self.get_humidifier(
+            {"fan_mode": 6, "desired_humidity": -1, "water_level": 2}
+        )
+
+        assert device.fan_mode_string == "Unknown"
+        assert device.desired_humidity_percent == "Unknown"
+        assert device.water_level_string == "Good"